@@ -1,287 +1,404 @@
-#!/usr/bin/env python3.7
+#!/usr/bin/env python3
 
 """Script to query/control Mitsubishi Heavy Industries aircon units"""
 
 # NB: extremely Work In Progress, here be dragons, enter at own risk, etc
 
-import base64
 import argparse
+import binascii
+import itertools
+import json
+import logging
+import struct
+import threading
 import time
 import requests
 
 from zeroconf import Zeroconf, ServiceStateChange, ServiceBrowser
+from collections import namedtuple
 from typing import cast
 
 import constants
 import config
 
+_log = logging.getLogger(__name__)
+
+def _crc16_ccitt(buf, crc=65535):
+    """CRC-16-CCITT of any bytes-like object (bytes, bytearray, memoryview)"""
+    # binascii's crc_hqx is the same non-reflected poly 0x1021 CRC the
+    # aircon expects, computed in C
+    return binascii.crc_hqx(buf, crc)
+
+# Layout of each frame produced by Settings.to_bytes
+SETTINGS_LEN = 18
+FRAME_TRAILER = b'\x01\xff\xff\xff\xff'
+_CRC_STRUCT = struct.Struct('<H')
+FRAME_LEN = SETTINGS_LEN + len(FRAME_TRAILER) + _CRC_STRUCT.size
+
+# A telemetry record in the airconStat blob, after the settings bytes
+_RECORD = struct.Struct('4B')
+
 class AttrBase:
+    """Describes one setting within the settings bytes.
+
+    Attributes are declared once on the Settings class; the values
+    themselves live in slots on each Settings instance. Accessing an
+    attribute through an instance gives a BoundAttr.
+    """
+    __slots__ = ('name', 'slot')
+
     def __init__(self, name):
         self.name = name
-        self.value = None
+        self.slot = None
 
-    def __str__(self):
-        return f'{self.name}: {repr(self.value)}'
+    def __get__(self, settings, owner=None):
+        if settings is None:
+            return self
+        return BoundAttr(self, settings)
 
-    def set(self, value):
-        self.value = value
+    def assign_slots(self, slot):
+        """Claim value slot(s) starting at `slot`, return the next free one"""
+        self.slot = slot
+        return slot + 1
 
-    def set_from_bytes(self, byte_array):
-        raise NotImplementedError
+    def describe(self, settings):
+        return f'{self.name}: {repr(self.get(settings))}'
+
+    def get(self, settings):
+        return settings._values[self.slot]
 
-    def apply(self, byte_array, is_control=None):
+    def set(self, settings, value):
+        settings._values[self.slot] = value
+
+    def codec_steps(self):
+        """CodecSteps that Settings runs to decode/encode this attribute"""
         raise NotImplementedError
 
+# One byte field of the settings bytes, flattened for Settings' codec
+# loops: the value slot, where it lives in the frame, and how to convert
+CodecStep = namedtuple('CodecStep', ['slot', 'bytepos', 'mask', 'controlbit',
+                                     'value_mask', 'of_byte', 'to_byte'])
+
+class BoundAttr:
+    """An attribute as seen through one Settings instance"""
+    __slots__ = ('_attr', '_settings')
+
+    def __init__(self, attr, settings):
+        self._attr = attr
+        self._settings = settings
+
+    def __str__(self):
+        return self._attr.describe(self._settings)
+
+    @property
+    def name(self):
+        return self._attr.name
+
+    @property
+    def value(self):
+        return self._attr.get(self._settings)
+
+    @value.setter
+    def value(self, value):
+        self._attr.set(self._settings, value)
+
+    def set(self, value):
+        self._attr.set(self._settings, value)
+
 class AttrByte(AttrBase):
+    __slots__ = ('bytepos', 'mask', 'controlbit', '_value_mask', 'to_byte', 'of_byte')
+
     def __init__(self, name, bytepos, mask=None, controlbit=None, to_byte=None, of_byte=None):
         super().__init__(name)
-        self.name = name
         self.bytepos = bytepos
-        self.mask = mask
-        self.controlbit = controlbit
-        self.value = None
-        self.is_control = False
+        # Normalise once so the codec loops in Settings need no None checks:
+        # no mask keeps the whole byte, no controlbit is a zero bit.
+        self.mask = 255 if mask is None else mask
+        self.controlbit = controlbit or 0
+        self._value_mask = self.mask & ~self.controlbit
         self.to_byte = to_byte
         self.of_byte = of_byte
 
-    def set_from_bytes(self, byte_array):
-        byte = byte_array[self.bytepos]
-        if self.mask:
-            byte &= self.mask
-        if self.controlbit:
-            self.is_control = bool(byte & self.controlbit)
-            byte &= ~ self.controlbit
-        if self.of_byte:
-            byte = self.of_byte(byte)
-        self.value = byte
-
-    def apply(self, byte_array, is_control=None):
-        if is_control is None:
-            is_control = self.is_control
-        byte = self.value if self.value else 0
-        if self.to_byte:
-            byte = self.to_byte(byte)
-        if self.mask:
-            byte &= self.mask
-        if is_control and self.controlbit:
-            byte |= self.controlbit
-        byte_array[self.bytepos] |= byte
+    def codec_steps(self):
+        return [CodecStep(self.slot, self.bytepos, self.mask, self.controlbit,
+                          self._value_mask, self.of_byte, self.to_byte)]
+
+    def possible_values(self):
+        """Every value this field can hold: anything it can decode, or None"""
+        (step,) = self.codec_steps()
+        raw = [b for b in range(256) if not b & ~step.value_mask]
+        decoded = [step.of_byte(b) for b in raw] if step.of_byte else raw
+        return list(dict.fromkeys(decoded + [None]))
 
 class AttrByteEnum(AttrByte):
+    __slots__ = ('_values', '_byte_to_val', '_val_to_byte', '_value_names')
+
     def __init__(self, name, bytepos, mask=None, controlbit=None, values=None):
-        byte_to_val = dict((b, i) for (b, i, _name) in values)
-        val_to_byte = dict((i, b) for (b, i) in byte_to_val.items())
         super().__init__(name,
                          bytepos,
                          mask=mask,
-                         controlbit=controlbit,
-                         to_byte=val_to_byte.get,
-                         of_byte=byte_to_val.get)
+                         controlbit=controlbit)
         self._values = values or []
+        self._byte_to_val = dict((b, i) for (b, i, _name) in self._values)
+        self._val_to_byte = dict((i, b & self.mask) for (b, i, _name) in self._values)
         self._value_names = dict((i, name) for (_b, i, name) in self._values)
 
-    def __str__(self):
-        s = super().__str__()
-        if self.value is None:
+    def codec_steps(self):
+        return [CodecStep(self.slot, self.bytepos, self.mask, self.controlbit,
+                          self._value_mask, self._byte_to_val.get,
+                          self._val_to_byte.__getitem__)]
+
+    def describe(self, settings):
+        s = super().describe(settings)
+        value = self.get(settings)
+        if value is None:
             return s
-        return f'{s} ({self._value_names[self.value]})'
+        return f'{s} ({self._value_names[value]})'
 
 class AttrAggregateEnum(AttrBase):
+    __slots__ = ('_components', '_values', '_value_names', '_lookup')
+
     def __init__(self, name, components, values=None):
         self._components = components
         self._values = values or []
-        self._component_value_to_value = { k: v for (k, v, _name) in self._values }
-        self._value_to_component_value = { v: k for (k, v, _name) in self._values }
         self._value_names = { v: name for (_k, v, name) in self._values }
+        # Map every component value tuple that can occur to its value, with
+        # wildcard (None) components expanded over all that component's
+        # possible values; the first matching entry wins, as it always has.
+        self._lookup = {}
+        domains = [c.possible_values() for c in components]
+        for (k, v, _name) in self._values:
+            choices = [domains[i] if k_i is None else (k_i,) for i, k_i in enumerate(k)]
+            for key in itertools.product(*choices):
+                self._lookup.setdefault(key, v)
         super().__init__(name)
 
-    def __str__(self):
-        s = super().__str__()
-        if self.value is None:
+    def assign_slots(self, slot):
+        for component in self._components:
+            slot = component.assign_slots(slot)
+        return slot
+
+    def describe(self, settings):
+        s = super().describe(settings)
+        value = self.get(settings)
+        if value is None:
             return s
-        return f'{s} ({self._value_names[self.value]})'
+        return f'{s} ({self._value_names[value]})'
 
-    @property
-    def value(self):
-        values = [c.value for c in self._components]
-        for (k, v, _name) in self._values:
-            if all(k_i is None or k_i == values[i] for i, k_i in enumerate(k)):
-                return v
-        return None
+    def get(self, settings):
+        return self._lookup.get(tuple(c.get(settings) for c in self._components))
 
-    @value.setter
-    def value(self, value):
+    def set(self, settings, value):
         if value is None:
             for c in self._components:
-                c.set(None)
+                c.set(settings, None)
             return
         for (k, v, _name) in self._values:
             if v == value:
                 for i, c_value in enumerate(k):
-                    self._components[i].set(c_value)
+                    self._components[i].set(settings, c_value)
                 return
         raise ValueError(f"{repr(value)} isn't a valid value for {self.name}")
 
-    def set_from_bytes(self, byte_array):
-        for component in self._components:
-            component.set_from_bytes(byte_array)
+    def codec_steps(self):
+        return [step for c in self._components for step in c.codec_steps()]
 
-    def apply(self, byte_array, is_control=None):
-        for component in self._components:
-            component.apply(byte_array, is_control=is_control)
+def _assign_slots(attributes):
+    slot = 0
+    for attr in attributes:
+        slot = attr.assign_slots(slot)
+    return slot
+
+# Value conversions used by the Settings attributes
+
+def _dec_on_off(b):
+    return b == 1
+
+def _enc_on_off(v):
+    return 1 if v else 0
+
+def _dec_half(b):
+    """Half-degree steps to a temperature"""
+    return b * 0.5
+
+def _enc_half(v):
+    return int(v * 2)
+
+def _dec_flag(b):
+    return 0 if b <= 0 else 1
 
 class Settings:
-    def __init__(self, aircon_id):
-        self.aircon_id = aircon_id
-        self.on_off = AttrByte('On/off',
-                               2,
-                               mask=3,
-                               controlbit=2,
-                               of_byte=lambda b: b == 1,
-                               to_byte=lambda v: 1 if v else 0)
-
-        self.preset_temp = AttrByte('Preset temperature',
-                                    4,
-                                    controlbit=128,
-                                    of_byte=lambda b: float(b)/2.0,
-                                    to_byte=lambda v: int(v*2))
-
-        self.op_mode = AttrByteEnum('Operation Mode',
-                                    2,
-                                    mask=60,
-                                    controlbit=32,
+    on_off = AttrByte('On/off',
+                      2,
+                      mask=3,
+                      controlbit=2,
+                      of_byte=_dec_on_off,
+                      to_byte=_enc_on_off)
+
+    preset_temp = AttrByte('Preset temperature',
+                           4,
+                           controlbit=128,
+                           of_byte=_dec_half,
+                           to_byte=_enc_half)
+
+    op_mode = AttrByteEnum('Operation Mode',
+                           2,
+                           mask=60,
+                           controlbit=32,
+                           values=[
+                               (0, 0, "Auto"),
+                               (8, 1, "Cool"),
+                               (16, 2, "Heat"),
+                               (12, 3, "Fan"),
+                               (4, 4, "Dry")])
+
+    airflow = AttrByteEnum('Airflow',
+                           3,
+                           mask=15,
+                           controlbit=8,
+                           values=[
+                               (7, 0, "Auto"),
+                               (0, 1, "|"),
+                               (1, 2, "||"),
+                               (2, 3, "|||"),
+                               (6, 4, "||||")])
+
+    entrust = AttrByteEnum('3D Auto',
+                           12,
+                           mask=12,
+                           controlbit=8,
+                           values=[
+                               (0, 0, "Off"),
+                               (4, 1, "On")])
+
+    model_no = AttrByte('Model Number',
+                        0,
+                        mask=127)
+
+    cool_hot_judge = AttrByte('Cool Hot Judge(?)',
+                              8,
+                              mask=8,
+                              of_byte=_dec_flag)
+
+    vacant_property = AttrByte('Vacant Property',
+                               10,
+                               mask=1)
+
+    self_clean = AttrByte('Self clean',
+                          15,
+                          mask=15)
+
+    wind_dir_ud = AttrAggregateEnum('Wind Direction (Up/Down)',
+                                    [ AttrByte('wind_ud_auto',
+                                               2,
+                                               mask=192,
+                                               controlbit=128),
+                                      AttrByte('wind_ud_pos',
+                                               3,
+                                               mask=240,
+                                               controlbit=128)
+                                    ],
                                     values=[
-                                        (0, 0, "Auto"),
-                                        (8, 1, "Cool"),
-                                        (16, 2, "Heat"),
-                                        (12, 3, "Fan"),
-                                        (4, 4, "Dry")])
-
-        self.airflow = AttrByteEnum('Airflow',
-                                    3,
-                                    mask=15,
-                                    controlbit=8,
+                                        ((64, None), 0, 'auto'),
+                                        ((0, 0), 1, '1'),
+                                        ((0, 16), 2, '2'),
+                                        ((0, 32), 3, '3'),
+                                        ((0, 48), 4, '4'),
+                                    ])
+
+    wind_dir_lr = AttrAggregateEnum('Wind Direction (Left/Right)',
+                                    [ AttrByte('wind_lr_auto',
+                                               12,
+                                               mask=3,
+                                               controlbit=2),
+                                      AttrByte('wind_lr_pos',
+                                               11,
+                                               mask=31,
+                                               controlbit=16)
+                                    ],
                                     values=[
-                                        (7, 0, "Auto"),
-                                        (0, 1, "|"),
-                                        (1, 2, "||"),
-                                        (2, 3, "|||"),
-                                        (6, 4, "||||")])
-
-        self.entrust = AttrByteEnum('3D Auto',
-                                    12,
-                                    mask=12,
-                                controlbit=8,
-                                    values=[
-                                        (0, 0, "Off"),
-                                        (4, 1, "On")])
-
-        self.model_no = AttrByte('Model Number',
-                                 0,
-                                 mask=127)
-
-        self.cool_hot_judge = AttrByte('Cool Hot Judge(?)',
-                                       8,
-                                       mask=8,
-                                       of_byte=lambda b: 0 if b <=0 else 1)
-
-        self.vacant_property = AttrByte('Vacant Property',
-                                        10,
-                                        mask=1)
-
-        self.self_clean = AttrByte('Self clean',
-                                   15,
-                                   mask=15)
-
-        self.wind_dir_ud = AttrAggregateEnum('Wind Direction (Up/Down)',
-                                             [ AttrByte('wind_ud_auto',
-                                                        2,
-                                                        mask=192,
-                                                        controlbit=128),
-                                               AttrByte('wind_ud_pos',
-                                                        3,
-                                                        mask=240,
-                                                        controlbit=128)
-                                             ],
-                                             values=[
-                                                 ((64, None), 0, 'auto'),
-                                                 ((0, 0), 1, '1'),
-                                                 ((0, 16), 2, '2'),
-                                                 ((0, 32), 3, '3'),
-                                                 ((0, 48), 4, '4'),
-                                             ])
-
-        self.wind_dir_lr = AttrAggregateEnum('Wind Direction (Left/Right)',
-                                             [ AttrByte('wind_lr_auto',
-                                                        12,
-                                                        mask=3,
-                                                        controlbit=2),
-                                               AttrByte('wind_lr_pos',
-                                                        11,
-                                                        mask=31,
-                                                        controlbit=16)
-                                             ],
-                                             values=[
-                                                 ((1, None), 0, 'auto'),
-                                                 ((0, 0), 1, '1'),
-                                                 ((0, 1), 2, '2'),
-                                                 ((0, 2), 3, '3'),
-                                                 ((0, 3), 4, '4'),
-                                                 ((0, 4), 5, '5'),
-                                                 ((0, 5), 6, '6'),
-                                                 ((0, 6), 7, '7'),
-                                             ])
-
-        self._attributes = [
-            'on_off',
-            'preset_temp',
-            'op_mode',
-            'airflow',
-            'entrust',
-            'model_no',
-            'cool_hot_judge',
-            'vacant_property',
-            'self_clean',
-            'wind_dir_ud',
-            'wind_dir_lr'
-        ]
+                                        ((1, None), 0, 'auto'),
+                                        ((0, 0), 1, '1'),
+                                        ((0, 1), 2, '2'),
+                                        ((0, 2), 3, '3'),
+                                        ((0, 3), 4, '4'),
+                                        ((0, 4), 5, '5'),
+                                        ((0, 5), 6, '6'),
+                                        ((0, 6), 7, '7'),
+                                    ])
+
+    _attributes = (
+        on_off,
+        preset_temp,
+        op_mode,
+        airflow,
+        entrust,
+        model_no,
+        cool_hot_judge,
+        vacant_property,
+        self_clean,
+        wind_dir_ud,
+        wind_dir_lr
+    )
+
+    _num_slots = _assign_slots(_attributes)
+    _codec = tuple(step for attr in _attributes for step in attr.codec_steps())
+
+    __slots__ = ('aircon_id', '_values', '_controls')
+
+    def __init__(self, aircon_id):
+        self.aircon_id = aircon_id
+        self._values = [None] * self._num_slots
+        self._controls = [False] * self._num_slots
 
     def __str__(self):
-        return '\n'.join('  ' + str(getattr(self, k)) for k in self._attributes)
+        return '\n'.join('  ' + attr.describe(self) for attr in self._attributes)
 
     def set_from_bytes(self, byte_array):
-        for attr in self._attributes:
-            getattr(self, attr).set_from_bytes(byte_array)
+        values = self._values
+        controls = self._controls
+        for (slot, bytepos, mask, controlbit, value_mask, of_byte, _to_byte) in self._codec:
+            byte = byte_array[bytepos] & mask
+            controls[slot] = bool(byte & controlbit)
+            byte &= value_mask
+            values[slot] = of_byte(byte) if of_byte else byte
 
     def to_bytes(self):
-        byte_array = []
-        for is_control in [True, False]:
-            buf = [0] * 18
-            buf[5] = 255
-            for attr in self._attributes:
-                getattr(self, attr).apply(buf, is_control=is_control)
+        # Two frames (command, then data), each 18 settings bytes, the
+        # 5 trailing bytes and a 2 byte CRC, written straight into one
+        # preallocated buffer.
+        out = bytearray(2 * FRAME_LEN)
+        with memoryview(out) as view:
+            control = view[:SETTINGS_LEN]
+            data = view[FRAME_LEN:FRAME_LEN + SETTINGS_LEN]
+            control[5] = data[5] = 255
+            values = self._values
+            for (slot, bytepos, mask, controlbit, _value_mask, _of_byte, to_byte) in self._codec:
+                value = values[slot]
+                byte = value if value else 0
+                if to_byte:
+                    byte = to_byte(byte)
+                byte &= mask
+                # Replace only this field's bits, leaving its neighbours
+                # in the same byte alone
+                control[bytepos] = (control[bytepos] & ~mask) | byte | controlbit
+                data[bytepos] = (data[bytepos] & ~mask) | byte
             # TODO: in the app code, if modelno == 1, these trailing
             # bytes of the 'command' data are set based on the
             # "HomeLeaveMode" settings
-            buf += [1, 255, 255, 255, 255]
-            byte_array += buf + self.crc(buf)
-
-        return byte_array
+            for start in [0, FRAME_LEN]:
+                crc_pos = start + SETTINGS_LEN + len(FRAME_TRAILER)
+                view[start + SETTINGS_LEN:crc_pos] = FRAME_TRAILER
+                _CRC_STRUCT.pack_into(view, crc_pos, _crc16_ccitt(view[start:crc_pos]))
 
+        return bytes(out)
 
     def crc(self, byte_array):
-        i = 65535
-        for b in byte_array:
-            for i2 in range(0, 8):
-                z = True
-                z2 = ((b >> (7 - i2)) & 1) == 1
-                if ((i >> 15) & 1) != 1:
-                    z = False
-                i <<= 1
-                if z2 ^ z:
-                    i ^= 4129
-        i = i & 65535
-        return [ i & 255, (i >> 8) & 255 ]
+        return _CRC_STRUCT.pack(_crc16_ccitt(byte_array))
+
+# Shared so repeated calls to the same unit reuse a keep-alive connection
+_SESSION = requests.Session()
+HTTP_TIMEOUT = 5  # seconds
 
 def call_aircon_command(aircon_ip, command, contents=None):
     url = f"http://{aircon_ip}:51443/beaver/command/{command}"
@@ -295,47 +412,103 @@ def call_aircon_command(aircon_ip, command, contents=None):
     if contents:
         data['contents'] = contents
 
-    #print("posting to %r" % url)
-    #print("data: %r" % data)
+    _log.debug("posting to %s", url)
+    _log.debug("data: %r", data)
 
-    response = requests.post(url, json=data)
+    response = _SESSION.post(url, json=data, timeout=HTTP_TIMEOUT)
     if response:
-        response = response.json()
+        # json.loads detects the UTF encoding of the raw body itself,
+        # skipping requests' charset guessing and decode to str
+        response = json.loads(response.content)
 
-    #print("response: %r" % response)
+    _log.debug("response: %r", response)
 
     if not response or response.get('result', None) != 0:
         raise Exception(f"Call to {url} failed")
     return response
 
+def _airconstat_slice(blob):
+    """Locate the settings bytes within an airconStat blob.
+
+    Returns the settings slice and the offset of the telemetry records
+    that follow it.
+    """
+    offset = blob[18] * 4 + 21
+    end = offset + SETTINGS_LEN
+    return blob[offset:end], end + 1
+
+def _error_code(b):
+    v = b & 127
+    if v == 0:
+        return "00"
+    elif b & 128 == 0:
+        return "M%02d" % v
+    else:
+        return "E%s" % v
+
+# Decoded error code for every possible value of the status error byte
+_ERROR_CODES = tuple(_error_code(b) for b in range(256))
+
+# Handlers for the telemetry records in an airconStat blob, keyed by the
+# record's first two bytes
+
+def _outdoor_temp_record(v3, v4, home_leave):
+    print("Outdoor Temp: %r" % constants.OUTDOOR_TEMPS[v3])
+
+def _indoor_temp_record(v3, v4, home_leave):
+    print("Indoor Temp: %r" % constants.INDOOR_TEMPS[v3])
+
+def _electric_record(v3, v4, home_leave):
+    print("Electric: %r" % (((v4 << 8) | v3) * 0.25))
+
+def _home_leave_air_flow(v4):
+    return constants.HOME_LEAVE_MODE_AIR_FLOW[v4 & 15]
+
+# Home leave mode settings, keyed by the record's third byte
+_HOME_LEAVE_FIELDS = {
+    27: ('cooling_temp_rule', _dec_half),
+    28: ('heating_temp_rule', _dec_half),
+    29: ('cooling_temp_setting', _dec_half),
+    30: ('heating_temp_setting', _dec_half),
+    31: ('cooling_air_flow', _home_leave_air_flow),
+    32: ('heating_air_flow', _home_leave_air_flow),
+}
+
+def _home_leave_record(v3, v4, home_leave):
+    field = _HOME_LEAVE_FIELDS.get(v3)
+    if field:
+        name, decode = field
+        home_leave[name] = decode(v4)
+
+_RECORD_HANDLERS = {
+    (128, 16): _outdoor_temp_record,
+    (128, 32): _indoor_temp_record,
+    (148, 16): _electric_record,
+    (248, 16): _home_leave_record,
+}
+
 def get_status(args):
     r = call_aircon_command(
         args.IP,
         'getAirconStat',
         contents={ "airconId": 'unused-but-required' })
 
-    #print("Got response:\n" + json.dumps(r, indent=2))
-    blob = base64.b64decode(r['contents']['airconStat'])
+    if _log.isEnabledFor(logging.DEBUG):
+        _log.debug("Got response:\n%s", json.dumps(r, indent=2))
+    # Slices of a memoryview don't copy, so the chunks below are views
+    blob = memoryview(binascii.a2b_base64(r['contents']['airconStat']))
 
     def print_hex(bs):
         print(' '.join('%02x' % b for b in bs))
 
     print_hex(blob)
 
-    #print(repr(blob))
-    #print(len(blob))
+    _log.debug("blob length: %d", len(blob))
 
-    offset = blob[18] * 4 + 21
-    #print(offset)
-    end = offset + 18
-
-    chunk1 = blob[offset:end]  # r5
+    chunk1, offset = _airconstat_slice(blob)  # r5
 
     print_hex(chunk1)
 
-    #print(repr(chunk1))
-
-    offset += 19
     end = len(blob) - 2
 
     chunk2 = blob[offset:end]  # r1
@@ -346,51 +519,17 @@ def get_status(args):
     print(settings)
 
 
-    v = chunk1[6] & 127
-    if v == 0:
-        error_code = "00"
-    elif chunk1[6] & 128 <= 0:
-        error_code = "M%02d" % int(v)
-    else:
-        error_code = "E%s" % str(v)
+    error_code = _ERROR_CODES[chunk1[6]]
     print("Error code: %r" % error_code)
 
 
-    p = 0
-    while (len(chunk2) / 4) > p:
-        y = p * 4
-        p += 1
-        v1 = chunk2[y]   # r12
-        v2 = chunk2[y+1] # r4
-        v3 = chunk2[y+2] # r3
-        v4 = chunk2[y+3] # r11
-        if v1 == 128 and v2 == 16:
-            outdoor_temp = constants.OUTDOOR_TEMPS[v3 & 255]
-            print("Outdoor Temp: %r" % outdoor_temp)
-        else:
-            if v1 == 128 and v2 == 32:
-                indoor_temp = constants.INDOOR_TEMPS[v3 & 255]
-                print("Indoor Temp: %r" % indoor_temp)
-            else:
-                if v1 == 148 and v2 == 16:
-                    electric = float((v4 & 255) << 8 + (v3 & 255)) * 0.25
-                    print("Electric: %r" % electric)
-                else:
-                    home_leave_mode_for_cooling = 0
-                    home_leave_mode_for_heating = 0
-                    if v1 == 248 and v2 == 16:
-                        if v3 == 27:
-                            home_leave_cooling_temp_rule = v4 / 2.0
-                        elif v3 == 28:
-                            home_leave_heating_temp_rule = v4 / 2.0
-                        elif v3 == 29:
-                            home_leave_cooling_temp_setting = v4 / 2.0
-                        elif v3 == 30:
-                            home_leave_heating_temp_setting = v4 / 2.0
-                        elif v3 == 31:
-                            home_leave_cooling_air_flow = constants.HOME_LEAVE_MODE_AIR_FLOW[v4 & 15]
-                        elif v3 == 32:
-                            home_leave_heating_air_flow = constants.HOME_LEAVE_MODE_AIR_FLOW[v4 & 15]
+    home_leave = {}
+    whole_records = len(chunk2) - len(chunk2) % _RECORD.size
+    # v1..v4 are r12, r4, r3, r11 in the app code
+    for v1, v2, v3, v4 in _RECORD.iter_unpack(chunk2[:whole_records]):
+        handler = _RECORD_HANDLERS.get((v1, v2))
+        if handler:
+            handler(v3, v4, home_leave)
 
     return settings
 
@@ -410,7 +549,7 @@ def set_status(args):
 
     print(f"New settings:\n{settings}")
 
-    payload = base64.b64encode(bytes(settings.to_bytes())).decode('utf-8')
+    payload = binascii.b2a_base64(settings.to_bytes(), newline=False).decode('ascii')
 
     r = call_aircon_command(
         args.IP,
@@ -420,13 +559,10 @@ def set_status(args):
             "airconStat": payload,
         })
 
-    blob = base64.b64decode(r['contents']['airconStat'])
-
-    offset = blob[18] * 4 + 21
-    end = offset + 18
+    blob = memoryview(binascii.a2b_base64(r['contents']['airconStat']))
 
     updated_settings = Settings(r['contents']['airconId'])
-    updated_settings.set_from_bytes(blob[offset:end])
+    updated_settings.set_from_bytes(_airconstat_slice(blob)[0])
 
     print(f"Updated settings:\n{updated_settings}")
 
@@ -462,6 +598,9 @@ def get_info(args):
 
 
 def find_devices(args):
+    done = threading.Event()
+    found = []
+
     def on_service_state_change(
             zeroconf: Zeroconf, service_type: str, name: str, state_change: ServiceStateChange
     ) -> None:
@@ -473,18 +612,20 @@ def find_devices(args):
                 print(f"Server: {info.server}")
                 print(f"Addresses: {' '.join(addrs)}")
                 print()
+                found.append(name)
+                if args.count and len(found) >= args.count:
+                    done.set()
 
     zc = Zeroconf()
     ServiceBrowser(zc, ['_beaver._tcp.local.'], handlers=[on_service_state_change])
-    until = time.time() + args.timeout
     try:
-        while time.time() < until:
-            time.sleep(0.1)
+        done.wait(args.timeout)
     finally:
         zc.close()
 
 def main():
     parser = argparse.ArgumentParser()
+    parser.add_argument('--debug', action='store_true', help="Log requests and responses")
 
     subs = parser.add_subparsers()
 
@@ -502,6 +643,7 @@ def main():
 
     p_find = subs.add_parser('find', help="Find aircon devices")
     p_find.add_argument('--timeout', type=float, default=2.0, help="How long to wait (seconds)")
+    p_find.add_argument('--count', type=int, help="Stop once this many devices have been found")
     p_find.set_defaults(func=find_devices)
 
     p_set = subs.add_parser('set', help="Set aircon settings")
@@ -515,6 +657,7 @@ def main():
     p_set.set_defaults(on_off=None, func=set_status)
 
     args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.WARNING)
     args.func(args)
 
 if __name__ == '__main__':
@@ -1,12 +1,26 @@
 """Local configuration"""
-import os
+import functools
 import socket
 import getpass
 
-MY_DEVICE_ID = socket.gethostname()
-MY_OPERATOR_ID = getpass.getuser()
+# MY_DEVICE_ID, MY_OPERATOR_ID and TIMEZONE are resolved on first use
+# (see __getattr__ below) rather than at import time.
 
-TIMEZONE='UTC'
-if os.path.exists('/etc/timezone'):
-    with open('/etc/timezone', 'r', encoding='utf-8') as f:
-        TIMEZONE=f.read().strip()
+@functools.lru_cache(maxsize=None)
+def _timezone():
+    try:
+        with open('/etc/timezone', 'r', encoding='utf-8') as f:
+            return f.read().strip()
+    except OSError:
+        return 'UTC'
+
+_LAZY = {
+    'MY_DEVICE_ID': functools.lru_cache(maxsize=None)(socket.gethostname),
+    'MY_OPERATOR_ID': functools.lru_cache(maxsize=None)(getpass.getuser),
+    'TIMEZONE': _timezone,
+}
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return _LAZY[name]()
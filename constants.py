@@ -1,6 +1,10 @@
 #!/usr/bin/env python3.7
 
-OUTDOOR_TEMPS = [
+from array import array
+
+# Temperature sensor readings, indexed by the raw status byte. Stored as
+# unboxed doubles; the values (and their repr) are unchanged.
+OUTDOOR_TEMPS = array('d', [
     -50.0,
     -50.0,
     -50.0,
@@ -257,9 +261,9 @@ OUTDOOR_TEMPS = [
     42.3,
     42.6,
     43.0
-]
+])
 
-INDOOR_TEMPS = [
+INDOOR_TEMPS = array('d', [
     -30.0,
     -30.0,
     -30.0,
@@ -516,6 +520,7 @@ INDOOR_TEMPS = [
     51.3,
     51.6,
     52.0
-]
+])
 
-HOME_LEAVE_MODE_AIR_FLOW = [0, 0, 0, 1, 0, 2, 0, 3, 0, 0, 0, 0, 0, 0, 4]
+# Home leave mode airflow, indexed by the low nibble of the status byte
+HOME_LEAVE_MODE_AIR_FLOW = (0, 0, 0, 1, 0, 2, 0, 3, 0, 0, 0, 0, 0, 0, 4, 0)